@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 import os
+import shutil
 import tarfile
 import tempfile
 from unittest import TestCase
@@ -41,9 +42,7 @@ with open(property_path) as f:
 
 def read_file_and_cast(file_path):
     with open(file_path, "r") as file:
-        d = file.readline()
-        data_list = list(map(lambda s: float(s), d.split(", ")))
-        return data_list
+        return np.fromstring(file.readline(), dtype=np.float32, sep=",")
 
 
 class TestEstimatorForOpenVINO(TestCase):
@@ -52,31 +51,53 @@ class TestEstimatorForOpenVINO(TestCase):
         output_file_path = os.path.join(resource_path, "orca/learn/resnet_output")
         self.input = read_file_and_cast(input_file_path)
         self.output = read_file_and_cast(output_file_path)
-        self.input = np.array(self.input).reshape([3, 224, 224])
-        self.output = np.array(self.output).reshape([4, 1000])[:1]
-
-        with tempfile.TemporaryDirectory() as local_path:
-            model_url = data_url + "/analytics-zoo-data/openvino2020_resnet50.tar"
-            model_path = maybe_download("openvino2020_resnet50.tar",
-                                        local_path, model_url)
-            tar = tarfile.open(model_path)
-            tar.extractall(path=local_path)
-            tar.close()
-            model_path = os.path.join(local_path, "openvino2020_resnet50/resnet_v1_50.xml")
-            self.est = Estimator.from_openvino(model_path=model_path)
+        self.input = self.input.reshape([3, 224, 224])
+        self.output = self.output.reshape([4, 1000])[:1]
+
+        self.local_path = tempfile.mkdtemp()
+        model_url = data_url + "/analytics-zoo-data/openvino2020_resnet50.tar"
+        model_path = maybe_download("openvino2020_resnet50.tar",
+                                    self.local_path, model_url)
+        tar = tarfile.open(model_path)
+        tar.extractall(path=self.local_path)
+        tar.close()
+        self.model_path = os.path.join(self.local_path, "openvino2020_resnet50/resnet_v1_50.xml")
+        self.est = Estimator.from_openvino(model_path=self.model_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.local_path)
 
     def check_result(self, result, length=0):
-        if length == 0:
-            length = len(result)
-        return np.all(list(map(lambda i: np.allclose(result[i], self.output), range(0, length))))
+        result = np.asarray(result)
+        if length != 0:
+            result = result[:length]
+        # self.output has shape (1, 1000) and is broadcast against every row of result
+        return np.allclose(result, self.output)
 
     def test_openvino_predict_ndarray(self):
-        input_data = np.array([self.input] * 22)
+        input_data = np.broadcast_to(self.input, (22, 3, 224, 224))
         result = self.est.predict(input_data)
         assert isinstance(result, np.ndarray)
         assert result.shape == (22, 1000)
         assert self.check_result(result, 22)
 
+    def test_openvino_predict_list(self):
+        # 22 rows don't divide the model batch size, so the batches have different lengths
+        input_data = [np.broadcast_to(self.input, (22, 3, 224, 224))]
+        result = self.est.predict(input_data)
+        assert isinstance(result, np.ndarray)
+        assert result.shape == (22, 1000)
+        assert self.check_result(result, 22)
+
+    def test_openvino_nireq(self):
+        est = Estimator.from_openvino(model_path=self.model_path, nireq=2)
+        assert est.nireq == 2
+        result = est.predict(np.broadcast_to(self.input, (6, 3, 224, 224)))
+        assert result.shape == (6, 1000)
+        assert self.check_result(result, 6)
+        est.load(self.model_path)
+        assert est.nireq == 2
+
     def test_openvino_predict_xshards(self):
         input_data_list = [np.array([self.input] * 4), np.array([self.input] * 2)]
         sc = init_nncontext()
@@ -86,14 +107,28 @@ class TestEstimatorForOpenVINO(TestCase):
         def pre_processing(images):
             return {"x": images}
 
-        shards = shards.transform_shard(pre_processing)
+        for xshards, pre_fn in [(shards.transform_shard(pre_processing), None),
+                                (SparkXShards(rdd), pre_processing)]:
+            result = self.est.predict(xshards, pre_fn=pre_fn)
+            result_c = result.collect()
+            assert isinstance(result, SparkXShards)
+            assert result_c[0]["prediction"].shape == (4, 1000)
+            assert result_c[1]["prediction"].shape == (2, 1000)
+            assert self.check_result(result_c[0]["prediction"], 4)
+            assert self.check_result(result_c[1]["prediction"], 2)
+
+    def test_openvino_predict_xshards_list_feature(self):
+        # the number of predictions is the number of rows, not the number of inputs in the list
+        input_data_list = [np.array([self.input] * 3), np.array([self.input] * 1)]
+        sc = init_nncontext()
+        rdd = sc.parallelize(input_data_list, numSlices=2)
+        shards = SparkXShards(rdd).transform_shard(lambda images: {"x": [images]})
         result = self.est.predict(shards)
         result_c = result.collect()
-        assert isinstance(result, SparkXShards)
-        assert result_c[0]["prediction"].shape == (4, 1000)
-        assert result_c[1]["prediction"].shape == (2, 1000)
-        assert self.check_result(result_c[0]["prediction"], 4)
-        assert self.check_result(result_c[1]["prediction"], 2)
+        assert result_c[0]["prediction"].shape == (3, 1000)
+        assert result_c[1]["prediction"].shape == (1, 1000)
+        assert self.check_result(result_c[0]["prediction"], 3)
+        assert self.check_result(result_c[1]["prediction"], 1)
 
     def test_openvino_predict_spark_df(self):
         from pyspark.sql import SparkSession
@@ -101,18 +136,59 @@ class TestEstimatorForOpenVINO(TestCase):
         sc = init_nncontext()
         spark = SparkSession(sc)
         input_list = self.input.tolist()
-        rdd = sc.range(0, 18, numSlices=3)
-        input_df = rdd.map(lambda x: [input_list]).toDF(["feature"])
-        with self.assertRaises(Exception):
-            self.est.predict(input_df, feature_cols=["feature"])
-        rdd = sc.range(0, 18, numSlices=5)
-        input_df = rdd.map(lambda x: [input_list]).toDF(["feature"])
-        result_df = self.est.predict(input_df, feature_cols=["feature"])
-        result = list(map(lambda row: np.array(row["prediction"]),
-                          result_df.select("prediction").collect()))
-        assert np.array(result_df.select("prediction").first()).shape == (1, 1000)
-        assert result_df.count() == 18
-        assert self.check_result(result, 18)
+        # partitions of 6 rows are larger than the model batch size and are split into batches
+        for num_slices in [3, 5]:
+            rdd = sc.range(0, 18, numSlices=num_slices)
+            input_df = rdd.map(lambda x: [input_list]).toDF(["feature"])
+            result_df = self.est.predict(input_df, feature_cols=["feature"])
+            result = list(map(lambda row: np.array(row["prediction"]),
+                              result_df.select("prediction").collect()))
+            assert np.array(result_df.select("prediction").first()).shape == (1, 1000)
+            assert result_df.count() == 18
+            assert self.check_result(result, 18)
+
+
+class TestEstimatorForOpenVINOArgs(TestCase):
+    # The arguments are checked before Spark and the model are set up, so a tiny IR xml file
+    # is enough.
+    fp32_ir = """<?xml version="1.0" ?>
+<net name="test" version="10">
+    <layers>
+        <layer id="0" name="input" type="Parameter" version="opset1">
+            <data element_type="f32" shape="4,3"/>
+            <output>
+                <port id="0" precision="FP32">
+                    <dim>4</dim>
+                    <dim>3</dim>
+                </port>
+            </output>
+        </layer>
+    </layers>
+</net>
+"""
+
+    def setUp(self):
+        self.local_path = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.local_path, "fp32.xml")
+        with open(self.model_path, "w") as f:
+            f.write(self.fp32_ir)
+
+    def tearDown(self):
+        shutil.rmtree(self.local_path)
+
+    def test_openvino_invalid_precision(self):
+        with self.assertRaises(ValueError):
+            Estimator.from_openvino(model_path=self.model_path, precision="fp16")
+        with self.assertRaises(ValueError):
+            Estimator.from_openvino(model_path=self.model_path, precision=None)
+
+    def test_openvino_invalid_nireq(self):
+        with self.assertRaises(ValueError):
+            Estimator.from_openvino(model_path=self.model_path, nireq=-1)
+
+    def test_openvino_int8_precision_with_fp32_ir(self):
+        with self.assertRaises(ValueError):
+            Estimator.from_openvino(model_path=self.model_path, precision="int8")
 
 
 if __name__ == "__main__":
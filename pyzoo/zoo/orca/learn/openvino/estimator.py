@@ -15,8 +15,10 @@
 #
 import math
 
+from py4j.protocol import Py4JError
 from zoo.pipeline.inference import InferenceModel
 from zoo.orca.data import SparkXShards
+from zoo.orca.data.utils import get_size
 from zoo.orca.learn.spark_estimator import Estimator as SparkEstimator
 from zoo import get_node_and_core_number
 from zoo.util import nest
@@ -27,38 +29,81 @@ import numpy as np
 
 class Estimator(object):
     @staticmethod
-    def from_openvino(*, model_path, batch_size=0):
+    def from_openvino(*, model_path, batch_size=0, precision="fp32", nireq=0):
         """
         Load an openVINO Estimator.
 
         :param model_path: String. The file path to the OpenVINO IR xml file.
         :param batch_size: Int. Set batch Size, default is 0 (use default batch size).
+        :param precision: String. "fp32" or "int8", the latter for IRs quantized by POT, default
+               is "fp32". There is no "bf16" option, the OpenVINO CPU plugin decides whether
+               a fp32 IR runs in bf16.
+        :param nireq: Int. The number of concurrent inference requests on each node, default is
+               0 (use the number of cores on each node, i.e. one request per Spark task slot).
         """
-        return OpenvinoEstimator(model_path=model_path, batch_size=batch_size)
+        return OpenvinoEstimator(model_path=model_path, batch_size=batch_size,
+                                 precision=precision, nireq=nireq)
 
 
 class OpenvinoEstimator(SparkEstimator):
     def __init__(self,
                  *,
                  model_path,
-                 batch_size=0):
+                 batch_size=0,
+                 precision="fp32",
+                 nireq=0):
+        if precision not in ("fp32", "int8"):
+            raise ValueError("precision should be either fp32 or int8, but get {}"
+                             .format(precision))
+        if precision == "int8" and not OpenvinoEstimator._is_int8_ir(model_path):
+            raise ValueError("precision is int8, but no quantized layer is found in the openVINO "
+                             "IR xml file, please check your model_path")
+        if nireq < 0:
+            raise ValueError("nireq should be a positive int, or 0 to use the number of cores, "
+                             "but get {}".format(nireq))
         self.node_num, self.core_num = get_node_and_core_number()
         self.path = model_path
+        self.nireq = nireq if nireq > 0 else self.core_num
         if batch_size != 0:
             self.batch_size = batch_size
         else:
-            import xml.etree.ElementTree as ET
-            tree = ET.parse(model_path)
-            root = tree.getroot()
-            shape_item = root.find('./layers/layer/output/port/dim[1]')
-            if shape_item is None:
-                raise ValueError("Invalid openVINO IR xml file, please check your model_path")
-            self.batch_size = int(shape_item.text)
-        self.model = InferenceModel(supported_concurrent_num=self.core_num)
+            self.batch_size = OpenvinoEstimator._infer_batch_size(model_path)
+        self.model = InferenceModel(supported_concurrent_num=self.nireq)
         self.model.load_openvino_ng(model_path=model_path,
                                     weight_path=model_path[:model_path.rindex(".")] + ".bin",
                                     batch_size=self.batch_size)
 
+    @staticmethod
+    def _infer_batch_size(model_path):
+        # The batch size is the first dim of the first layer output, i.e.
+        # ./layers/layer/output/port/dim[1]. Stream the xml file and stop at this element
+        # instead of parsing the whole IR.
+        import xml.etree.ElementTree as ET
+        target_path = ["layers", "layer", "output", "port", "dim"]
+        path = []
+        for event, elem in ET.iterparse(model_path, events=("start", "end")):
+            if event == "start":
+                path.append(elem.tag)
+            else:
+                if path[1:] == target_path:
+                    return int(elem.text)
+                path.pop()
+        raise ValueError("Invalid openVINO IR xml file, please check your model_path")
+
+    @staticmethod
+    def _is_int8_ir(model_path):
+        # The same check the model loader uses to pick the int8 kernels: IR version 9 or
+        # previous has a statistics section, IR version 10 or later has FakeQuantize layers.
+        # Elements are cleared once checked, so a fp32 IR is streamed rather than built into
+        # a tree.
+        import xml.etree.ElementTree as ET
+        for _, elem in ET.iterparse(model_path, events=("end",)):
+            if elem.tag == "statistics" or \
+                    (elem.tag == "layer" and elem.get("type") == "FakeQuantize"):
+                return True
+            elem.clear()
+        return False
+
     def fit(self, data, epochs, batch_size=32, feature_cols=None, label_cols=None,
             validation_data=None, checkpoint_trigger=None):
         """
@@ -66,15 +111,20 @@ class OpenvinoEstimator(SparkEstimator):
         """
         raise NotImplementedError
 
-    def predict(self, data, feature_cols=None):
+    def predict(self, data, feature_cols=None, pre_fn=None):
         """
         Predict input data
 
         :param data: data to be predicted. XShards, Spark DataFrame, numpy array and list of numpy
                arrays are supported. If data is XShards, each partition is a dictionary of  {'x':
                feature}, where feature(label) is a numpy array or a list of numpy arrays.
+               If data is a Spark DataFrame, the rows in each partition are stacked into
+               batches of at most the model batch size.
         :param feature_cols: Feature column name(s) of data. Only used when data is a Spark
                DataFrame. Default: None.
+        :param pre_fn: python function to process each shard of data into the dictionary of
+               {'x': feature} described above. Only used when data is XShards. It is applied
+               to each shard once, instead of in a separate transform_shard. Default: None.
         :return: predicted result.
                  If the input data is XShards, the predict result is a XShards, each partition
                  of the XShards is a dictionary of {'prediction': result}, where the result is a
@@ -84,6 +134,26 @@ class OpenvinoEstimator(SparkEstimator):
         """
         from pyspark.sql import DataFrame
 
+        def pad_to_batch_size(arr, batch_size):
+            # zero rows are appended so that each inference call has the model batch size, the
+            # predictions of these rows are dropped with the number of rows of the unpadded shard
+            if arr.shape[0] == batch_size:
+                return arr
+            padded = np.zeros((batch_size,) + arr.shape[1:], dtype=arr.dtype)
+            padded[:arr.shape[0]] = arr
+            return padded
+
+        def pad_transform(dict_data, batch_size):
+            feature_data = dict_data["x"]
+            if isinstance(feature_data, np.ndarray):
+                return pad_to_batch_size(feature_data, batch_size)
+            # a DataFrame with multiple feature columns gives a tuple of ndarrays, the inputs of
+            # a model with multiple inputs are passed as a list
+            if isinstance(feature_data, (list, tuple)):
+                return [pad_to_batch_size(elem, batch_size) for elem in feature_data]
+            raise ValueError("x in each shard should be a ndarray, a list or a tuple of ndarray, "
+                             "but get " + feature_data.__class__.__name__)
+
         def predict_transform(dict_data, batch_size):
             assert isinstance(dict_data, dict), "each shard should be an dict"
             assert "x" in dict_data, "key x should in each shard"
@@ -94,58 +164,90 @@ class OpenvinoEstimator(SparkEstimator):
                     "batch size, otherwise some inputs will be ignored."
             elif isinstance(feature_data, list):
                 for elem in feature_data:
-                    assert isinstance(elem, np.ndarray), "Each element in the x list should be " \
-                                                         "a ndarray, but get " + \
-                                                         elem.__class__.__name__
-                    assert elem.shape[0] <= batch_size, "The batch size of each input data (the " \
-                                                        "second dim) should be less than the " \
-                                                        "model batch size, otherwise some inputs " \
-                                                        "will be ignored."
+                    assert isinstance(elem, np.ndarray), \
+                        "Each element in the x list should be a ndarray, but get " + \
+                        elem.__class__.__name__
+                    assert elem.shape[0] <= batch_size, \
+                        "The batch size of each input data (the second dim) should be less " \
+                        "than the model batch size, otherwise some inputs will be ignored."
             else:
                 raise ValueError("x in each shard should be a ndarray or a list of ndarray.")
-            return feature_data
+            return pad_transform(dict_data, batch_size)
 
         sc = init_nncontext()
+        batch_size = self.batch_size
 
+        # The inference runs in the JVM, which can't carry the python shards along, so the
+        # predictions are zipped back with the input shards. The inputs of the model are mapped
+        # from the cached input shards directly: unlike transform_shard, this neither caches
+        # a padded copy of the input nor uncaches the input that the zip reads again.
         if isinstance(data, DataFrame):
             from zoo.orca.learn.utils import dataframe_to_xshards, convert_predict_rdd_to_dataframe
             xshards, _ = dataframe_to_xshards(data,
                                               validation_data=None,
                                               feature_cols=feature_cols,
                                               label_cols=None,
-                                              mode="predict")
-            transformed_data = xshards.transform_shard(predict_transform, self.batch_size)
-            result_rdd = self.model.distributed_predict(transformed_data.rdd, sc)
+                                              mode="predict",
+                                              shard_size=self.batch_size)
+            # the shards are built above from the rows of data, at most batch_size rows each,
+            # so only the type of x is checked, in pad_transform
+            transformed_rdd = xshards.rdd.map(lambda shard: pad_transform(shard, batch_size))
+            result_rdd = self.model.distributed_predict(transformed_rdd, sc,
+                                                        reuse_broadcast=True)
 
             def delete_useless_result(data):
                 shard, y = data
-                data_length = len(shard["x"])
+                data_length = get_size(shard["x"])
                 return y[: data_length]
             result_rdd = xshards.rdd.zip(result_rdd).map(delete_useless_result)
             return convert_predict_rdd_to_dataframe(data, result_rdd.flatMap(lambda data: data))
         elif isinstance(data, SparkXShards):
-            transformed_data = data.transform_shard(predict_transform, self.batch_size)
-            result_rdd = self.model.distributed_predict(transformed_data.rdd, sc)
+            if pre_fn is None:
+                input_rdd = data.rdd
+            else:
+                # the processed shards are read by both the inference and the zip below, they are
+                # cached so that pre_fn runs once per shard
+                input_shards = SparkXShards(data.rdd.map(pre_fn))
+                input_rdd = input_shards.rdd
+            transformed_rdd = input_rdd.map(lambda shard: predict_transform(shard, batch_size))
+            result_rdd = self.model.distributed_predict(transformed_rdd, sc,
+                                                        reuse_broadcast=True)
 
             def update_shard(data):
                 shard, y = data
-                data_length = len(shard["x"])
+                data_length = get_size(shard["x"])
                 shard["prediction"] = y[: data_length]
                 return shard
-            return SparkXShards(data.rdd.zip(result_rdd).map(update_shard))
+            result = SparkXShards(input_rdd.zip(result_rdd).map(update_shard))
+            if pre_fn is not None:
+                if result.eager:
+                    # the result is computed and cached, it no longer reads the processed shards
+                    input_shards.uncache()
+                else:
+                    # the processed shards stay cached until the lazy result is released
+                    result._pre_fn_shards = input_shards
+            return result
         elif isinstance(data, (np.ndarray, list)):
             if isinstance(data, np.ndarray):
                 split_num = math.ceil(len(data)/self.batch_size)
-                arrays = np.array_split(data, split_num)
+                num_partitions = min(split_num, self.node_num * self.core_num)
+                # Batch sizes differ by at most one row, so no batch is much slower than the
+                # others, e.g. 17 rows with batch size 16 are split into 8 and 9 rather than
+                # 16 and 1. The slices are views.
+                offsets = np.linspace(0, len(data), split_num + 1, dtype=int)
+                arrays = [data[offsets[i]: offsets[i + 1]] for i in range(split_num)]
                 data_length_list = list(map(lambda arr: len(arr), arrays))
-                data_rdd = sc.parallelize(arrays, numSlices=split_num)
+                # pickling a slice writes its raw buffer, non-contiguous slices such as those of a
+                # broadcast array are copied one batch at a time
+                data_rdd = sc.parallelize(arrays, numSlices=num_partitions)
             elif isinstance(data, list):
                 flattened = nest.flatten(data)
                 data_length = len(flattened[0])
-                data_to_be_rdd = []
                 split_num = math.ceil(flattened[0].shape[0]/self.batch_size)
-                for i in range(split_num):
-                    data_to_be_rdd.append([])
+                num_partitions = min(split_num, self.node_num * self.core_num)
+                # all the inputs are sliced at the same balanced offsets as an ndarray input
+                offsets = np.linspace(0, data_length, split_num + 1, dtype=int)
+                data_length_list = [offsets[i + 1] - offsets[i] for i in range(split_num)]
                 for x in flattened:
                     assert isinstance(x, np.ndarray), "the data in the data list should be " \
                                                       "ndarrays, but get " + \
@@ -153,19 +255,24 @@ class OpenvinoEstimator(SparkEstimator):
                     assert len(x) == data_length, \
                         "the ndarrays in data must all have the same size in first dimension" \
                         ", got first ndarray of size {} and another {}".format(data_length, len(x))
-                    x_parts = np.array_split(x, split_num)
-                    for idx, x_part in enumerate(x_parts):
-                        data_to_be_rdd[idx].append(x_part)
-                        data_length_list = list(map(lambda arr: len(arr), x_part))
 
-                data_to_be_rdd = [nest.pack_sequence_as(data, shard) for shard in data_to_be_rdd]
-                data_rdd = sc.parallelize(data_to_be_rdd, numSlices=split_num)
+                def get_batch(i):
+                    return nest.pack_sequence_as(data, [x[offsets[i]: offsets[i + 1]]
+                                                        for x in flattened])
+                data_to_be_rdd = [get_batch(i) for i in range(split_num)]
+                data_rdd = sc.parallelize(data_to_be_rdd, numSlices=num_partitions)
 
-            result_rdd = self.model.distributed_predict(data_rdd, sc)
+            # each partition holds several batches when there are more batches than cores,
+            # and runs them one after another
+            result_rdd = self.model.distributed_predict(data_rdd, sc, reuse_broadcast=True)
             result_arr_list = result_rdd.collect()
+            result_arr = np.empty((sum(data_length_list),) + result_arr_list[0].shape[1:],
+                                  dtype=result_arr_list[0].dtype)
+            offset = 0
             for i in range(0, len(result_arr_list)):
-                result_arr_list[i] = result_arr_list[i][:data_length_list[i]]
-            result_arr = np.concatenate(result_arr_list, axis=0)
+                length = data_length_list[i]
+                result_arr[offset: offset + length] = result_arr_list[i][:length]
+                offset += length
             return result_arr
         else:
             raise ValueError("Only XShards, Spark DataFrame, a numpy array and a list of numpy arr"
@@ -202,18 +309,21 @@ class OpenvinoEstimator(SparkEstimator):
         if batch_size != 0:
             self.batch_size = batch_size
         else:
-            import xml.etree.ElementTree as ET
-            tree = ET.parse(model_path)
-            root = tree.getroot()
-            shape_item = root.find('./layers/layer/output/port/dim[1]')
-            if shape_item is None:
-                raise ValueError("Invalid openVINO IR xml file, please check your model_path")
-            self.batch_size = int(shape_item.text)
-        self.model = InferenceModel(supported_concurrent_num=self.core_num)
+            self.batch_size = OpenvinoEstimator._infer_batch_size(model_path)
+        self.model.release_broadcast()
+        self.model = InferenceModel(supported_concurrent_num=self.nireq)
         self.model.load_openvino(model_path=model_path,
                                  weight_path=model_path[:model_path.rindex(".")] + ".bin",
                                  batch_size=batch_size)
 
+    def __del__(self):
+        if hasattr(self, "model"):
+            try:
+                self.model.release_broadcast()
+            except Py4JError:
+                # the JVM is already stopped, and the broadcast with it
+                pass
+
     def set_tensorboard(self, log_dir, app_name):
         """
         Set_tensorboard is not supported in OpenVINOEstimator
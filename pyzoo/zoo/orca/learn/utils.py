@@ -263,10 +263,12 @@ def process_xshards_of_pandas_dataframe(data, feature_cols, label_cols=None, val
         return data
 
 
-def _dataframe_to_xshards(data, feature_cols, label_cols=None, accept_str_col=False):
+def _dataframe_to_xshards(data, feature_cols, label_cols=None, accept_str_col=False,
+                          shard_size=None):
     from zoo.orca import OrcaContext
     schema = data.schema
-    shard_size = OrcaContext._shard_size
+    if shard_size is None:
+        shard_size = OrcaContext._shard_size
     numpy_rdd = data.rdd.map(lambda row: convert_row_to_numpy(row,
                                                               schema,
                                                               feature_cols,
@@ -280,7 +282,7 @@ def _dataframe_to_xshards(data, feature_cols, label_cols=None, accept_str_col=Fa
 
 
 def dataframe_to_xshards(data, validation_data, feature_cols, label_cols, mode="fit",
-                         num_workers=None, accept_str_col=False):
+                         num_workers=None, accept_str_col=False, shard_size=None):
     from pyspark.sql import DataFrame
     valid_mode = {"fit", "evaluate", "predict"}
     assert mode in valid_mode, f"invalid mode {mode} " \
@@ -300,10 +302,10 @@ def dataframe_to_xshards(data, validation_data, feature_cols, label_cols, mode="
             num_data_part = data.rdd.getNumPartitions()
             validation_data = validation_data.repartition(num_data_part)
 
-    data = _dataframe_to_xshards(data, feature_cols, label_cols, accept_str_col)
+    data = _dataframe_to_xshards(data, feature_cols, label_cols, accept_str_col, shard_size)
     if validation_data is not None:
         validation_data = _dataframe_to_xshards(validation_data, feature_cols, label_cols,
-                                                accept_str_col)
+                                                accept_str_col, shard_size)
 
     return data, validation_data
 
@@ -158,7 +158,16 @@ class InferenceModel(JavaValue):
                              input_is_table)
         return KerasNet.convert_output(output)
 
-    def distributed_predict(self, inputs, sc):
+    def distributed_predict(self, inputs, sc, reuse_broadcast=False):
+        """
+        Use the model to do distributed prediction on an RDD.
+
+        :param inputs: An RDD of numpy arrays or lists of numpy arrays.
+        :param sc: The SparkContext.
+        :param reuse_broadcast: Whether to keep the broadcast of the model for later calls, so
+               that the executors load the model only once. If True, release_broadcast should
+               be called once the model is no longer used. Default is False.
+        """
         data_type = inputs.map(lambda x: x.__class__.__name__).first()
         input_is_table = False
         if data_type == "list":
@@ -170,5 +179,13 @@ class InferenceModel(JavaValue):
                              self.value,
                              sc,
                              jinputs,
-                             input_is_table)
+                             input_is_table,
+                             reuse_broadcast)
         return output.map(lambda x: KerasNet.convert_output(x))
+
+    def release_broadcast(self):
+        """
+        Release the broadcast of this model that distributed_predict keeps for later calls
+        with reuse_broadcast, so that the model can be freed on the driver and the executors.
+        """
+        callZooFunc(self.bigdl_type, "inferenceModelReleaseBroadcast", self.value)
@@ -16,9 +16,12 @@
 
 package com.intel.analytics.zoo.orca.python
 
-import com.intel.analytics.zoo.pipeline.inference.InferenceModel
+import com.intel.analytics.zoo.pipeline.inference.{AbstractModel, InferenceModel}
+import org.apache.spark.SparkContext
 import org.apache.spark.api.java.{JavaRDD, JavaSparkContext}
-import java.util.{List => JList}
+import org.apache.spark.broadcast.Broadcast
+import java.lang.ref.WeakReference
+import java.util.{IdentityHashMap, List => JList}
 
 import com.intel.analytics.bigdl.tensor.TensorNumericMath.TensorNumeric
 import com.intel.analytics.zoo.common.PythonZoo
@@ -30,14 +33,64 @@ object PythonOrca {
   def ofFloat(): PythonOrca[Float] = new PythonOrca[Float]()
 
   def ofDouble(): PythonOrca[Double] = new PythonOrca[Double]()
+
+  private case class ModelBroadcast(sc: WeakReference[SparkContext],
+                                    originalModel: AbstractModel,
+                                    broadcast: Broadcast[InferenceModel])
+
+  // Keep the broadcast of the models predicted with reuseBroadcast, so that the executors
+  // deserialize them and load the native model once instead of once per predict call. The
+  // broadcast holds the model on the driver, so an entry is only removed explicitly: by
+  // releaseModelBroadcast, which the caller has to call once the model is replaced or no
+  // longer used, when the model is reloaded, or when its SparkContext is stopped. The
+  // ContextCleaner then frees the broadcast once no RDD refers to it any more.
+  private val modelBroadcasts = new IdentityHashMap[InferenceModel, ModelBroadcast]()
+
+  def broadcastModel(sc: JavaSparkContext, model: InferenceModel): Broadcast[InferenceModel] = {
+    modelBroadcasts.synchronized {
+      // broadcasts of another, i.e. stopped, SparkContext can't be used any more
+      val iter = modelBroadcasts.values().iterator()
+      while (iter.hasNext) {
+        if (!(iter.next().sc.get() eq sc.sc)) {
+          iter.remove()
+        }
+      }
+      val cached = modelBroadcasts.get(model)
+      if (cached != null && (cached.originalModel eq model.getOriginalModel)) {
+        cached.broadcast
+      } else {
+        if (cached != null) {
+          cached.broadcast.unpersist(blocking = false)
+        }
+        val broadcastModel = sc.broadcast(model)
+        modelBroadcasts.put(model, ModelBroadcast(new WeakReference(sc.sc),
+          model.getOriginalModel, broadcastModel))
+        broadcastModel
+      }
+    }
+  }
+
+  def releaseModelBroadcast(model: InferenceModel): Unit = {
+    modelBroadcasts.synchronized {
+      val cached = modelBroadcasts.remove(model)
+      if (cached != null && cached.sc.get() != null && !cached.sc.get().isStopped) {
+        cached.broadcast.unpersist(blocking = false)
+      }
+    }
+  }
 }
 
 class PythonOrca[T: ClassTag](implicit ev: TensorNumeric[T]) extends PythonZoo[T] {
   def inferenceModelDistriPredict(model: InferenceModel, sc: JavaSparkContext,
                                   inputs: JavaRDD[JList[com.intel.analytics.bigdl.python.api
                                   .JTensor]],
-                                  inputIsTable: Boolean): JavaRDD[JList[Object]] = {
-    val broadcastModel = sc.broadcast(model)
+                                  inputIsTable: Boolean,
+                                  reuseBroadcast: Boolean): JavaRDD[JList[Object]] = {
+    val broadcastModel = if (reuseBroadcast) {
+      PythonOrca.broadcastModel(sc, model)
+    } else {
+      sc.broadcast(model)
+    }
     inputs.rdd.mapPartitions(partition => {
       val localModel = broadcastModel.value
       partition.map(inputs => {
@@ -47,4 +100,8 @@ class PythonOrca[T: ClassTag](implicit ev: TensorNumeric[T]) extends PythonZoo[T
       })
     })
   }
+
+  def inferenceModelReleaseBroadcast(model: InferenceModel): Unit = {
+    PythonOrca.releaseModelBroadcast(model)
+  }
 }
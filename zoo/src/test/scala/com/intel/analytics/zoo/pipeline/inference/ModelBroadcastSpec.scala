@@ -0,0 +1,87 @@
+/*
+ * Copyright 2018 Analytics Zoo Authors.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+package com.intel.analytics.zoo.pipeline.inference
+
+import com.intel.analytics.zoo.common.NNContext
+import com.intel.analytics.zoo.orca.python.PythonOrca
+import org.apache.spark.api.java.JavaSparkContext
+import org.apache.spark.{SparkConf, SparkContext}
+import org.scalatest.{BeforeAndAfter, FlatSpec, Matchers}
+
+class ModelBroadcastSpec extends FlatSpec with Matchers with BeforeAndAfter {
+  val resource = getClass().getClassLoader().getResource("models")
+  val modelPath = resource.getPath + "/caffe/test_persist.prototxt"
+  val weightPath = resource.getPath + "/caffe/test_persist.caffemodel"
+
+  var sc: SparkContext = _
+  var model: InferenceModel = _
+
+  def createSparkContext(): SparkContext = {
+    val conf = new SparkConf().setAppName("Test model broadcast").setMaster("local[1]")
+    NNContext.initNNContext(conf)
+  }
+
+  before {
+    sc = createSparkContext()
+    model = new InferenceModel(1)
+    model.doLoadCaffe(modelPath, weightPath)
+  }
+
+  after {
+    PythonOrca.releaseModelBroadcast(model)
+    if (sc != null) {
+      sc.stop()
+    }
+  }
+
+  "broadcastModel" should "reuse the broadcast of the same model" in {
+    val jsc = new JavaSparkContext(sc)
+    val broadcast1 = PythonOrca.broadcastModel(jsc, model)
+    val broadcast2 = PythonOrca.broadcastModel(jsc, model)
+    broadcast2 should be theSameInstanceAs broadcast1
+
+    val anotherModel = new InferenceModel(1)
+    anotherModel.doLoadCaffe(modelPath, weightPath)
+    PythonOrca.broadcastModel(jsc, anotherModel) should not be theSameInstanceAs (broadcast1)
+    PythonOrca.releaseModelBroadcast(anotherModel)
+  }
+
+  "broadcastModel" should "broadcast a reloaded model again" in {
+    val jsc = new JavaSparkContext(sc)
+    val broadcast1 = PythonOrca.broadcastModel(jsc, model)
+    model.doLoadCaffe(modelPath, weightPath)
+    val broadcast2 = PythonOrca.broadcastModel(jsc, model)
+    broadcast2 should not be theSameInstanceAs (broadcast1)
+  }
+
+  "broadcastModel" should "broadcast the model again after it is released" in {
+    val jsc = new JavaSparkContext(sc)
+    val broadcast1 = PythonOrca.broadcastModel(jsc, model)
+    PythonOrca.releaseModelBroadcast(model)
+    PythonOrca.broadcastModel(jsc, model) should not be theSameInstanceAs (broadcast1)
+  }
+
+  "broadcastModel" should "broadcast the model again with a new SparkContext" in {
+    val broadcast1 = PythonOrca.broadcastModel(new JavaSparkContext(sc), model)
+    sc.stop()
+    sc = createSparkContext()
+    val broadcast2 = PythonOrca.broadcastModel(new JavaSparkContext(sc), model)
+    broadcast2 should not be theSameInstanceAs (broadcast1)
+    sc.parallelize(Seq(1, 2), 2).map(_ => broadcast2.value != null).collect() should
+      be (Array(true, true))
+  }
+}